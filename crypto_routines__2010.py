@@ -34,13 +34,255 @@
 ###############################################################################################################
 
 
+from collections import Counter
+import string
+import numpy
+
+## Numba is optional, and is only used to speed up fragment counting
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+
+## The number of characters of text cleaned and counted at a time by letter_stats
+_TEXT_PIECE_SIZE = 1 << 16
+
+## The longest fragment whose base 26 key fits in a (signed) 64-bit integer
+_MAX_PACKED_LENGTH = 13
+
+
+
+def _clean_text(text):
+    """
+    Returns the text with all non-alphabetic characters removed 
+    and the remaining (A-Z) letters capitalized.  
+
+    This works on the bytes of the text with numpy, where setting 
+    the 0x20 bit makes a letter lowercase (for the range test) and 
+    clearing it makes the letter uppercase.  Unicode text is first 
+    converted to its ASCII characters, since others are not letters 
+    here, and the bytes of its code units must not be read as ASCII.
+    """
+    if isinstance(text, unicode):
+        text = text.encode("ascii", "ignore")
+    char_codes = numpy.frombuffer(text, dtype=numpy.uint8)
+    lowercase_codes = char_codes | 0x20
+    is_letter = (lowercase_codes >= ord("a")) & (lowercase_codes <= ord("z"))
+    return (char_codes[is_letter] & 0xDF).tostring()
+
+
+
+def _count_fragment_keys(letter_codes, N, prefix_key=0, prefix_length=0, suffix_key=0, suffix_length=0):
+    """
+    Counts the fragments of length N in an array of letter codes 
+    (0 for A through 25 for Z), where each fragment is represented 
+    by its base 26 key.  The key is updated as a rolling sum, so 
+    no fragment strings are created.
+
+    Only fragments which start with the prefix and end with the 
+    suffix of the given keys and lengths are counted.  These are 
+    tested on the key as the quotient by 26^(N - prefix_length) 
+    and the remainder mod 26^suffix_length, which are both zero 
+    when there is no restriction.
+
+    INPUT:
+        letter_codes -- an int64 numpy array with entries 0 through 25
+        N -- an integer with 1 <= N <= _MAX_PACKED_LENGTH
+        prefix_key, suffix_key -- integers >= 0
+        prefix_length, suffix_length -- integers between 0 and N
+
+    OUTPUT:
+        a pair of int64 numpy arrays, of the distinct keys and their counts
+    """
+    counts = dict()
+    leading_digit = 26 ** (N - 1)
+    prefix_divisor = 26 ** (N - prefix_length)
+    suffix_modulus = 26 ** suffix_length
+    key = 0
+    for i in range(min(N - 1, len(letter_codes))):
+        key = key * 26 + letter_codes[i]
+    for i in range(N - 1, len(letter_codes)):
+        key = key * 26 + letter_codes[i]
+        if (key // prefix_divisor == prefix_key) & (key % suffix_modulus == suffix_key):
+            if key in counts:
+                counts[key] += 1
+            else:
+                counts[key] = 1
+        key -= letter_codes[i - N + 1] * leading_digit
+
+    distinct_keys = numpy.empty(len(counts), dtype=numpy.int64)
+    key_counts = numpy.empty(len(counts), dtype=numpy.int64)
+    i = 0
+    for key, count in counts.items():
+        distinct_keys[i] = key
+        key_counts[i] = count
+        i += 1
+    return distinct_keys, key_counts
+
+if numba is not None:
+    _count_fragment_keys = numba.njit(_count_fragment_keys)
+
+
+
+def _vectorized_count_fragment_keys(letter_codes, N, prefix_key=0, prefix_length=0, suffix_key=0, suffix_length=0):
+    """
+    Counts the base 26 keys of fragments exactly as in 
+    _count_fragment_keys, but finds all of the keys at once 
+    with numpy array operations, for when numba is not available.
+    """
+    fragment_count = len(letter_codes) - N + 1
+    if fragment_count <= 0:
+        return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64)
+
+    ## Add the letters of all fragments to their keys one position at a time
+    keys = numpy.zeros(fragment_count, dtype=numpy.int64)
+    for j in range(N):
+        keys *= 26
+        keys += letter_codes[j: j + fragment_count]
+
+    if prefix_length > 0 or suffix_length > 0:
+        keys = keys[(keys // 26 ** (N - prefix_length) == prefix_key) & (keys % 26 ** suffix_length == suffix_key)]
+
+    distinct_keys, key_counts = numpy.unique(keys, return_counts=True)
+    return distinct_keys, key_counts.astype(numpy.int64)
+
+
+
+def _encode_fragment_key(fragment):
+    """
+    Returns the base 26 key of a fragment of capital letters.
+    """
+    key = 0
+    for c in fragment:
+        key = key * 26 + ord(c) - ord("A")
+    return key
+
+
+
+def _decode_fragment_keys(keys, N):
+    """
+    Returns the list of fragments of length N with the given base 26 
+    keys (a numpy array).  The letters of all keys are found at once 
+    with numpy, and each row of letters is read as one string.
+    """
+    digits = (keys[:, numpy.newaxis] // 26 ** numpy.arange(N - 1, -1, -1)) % 26
+    return (digits + ord("A")).astype(numpy.uint8).view("S%d" % N).ravel().tolist()
+
+
+
+def _clean_pieces(text_pieces, N):
+    """
+    Cleans the pieces of a text one at a time, putting the last N-1 
+    letters of each cleaned piece in front of the next one, so that 
+    each fragment of length N is in exactly one of the cleaned pieces.
+    """
+    tail_text = ""
+    for text in text_pieces:
+        clean_text = tail_text + _clean_text(text)
+        yield clean_text
+        if N > 1:
+            tail_text = clean_text[-(N - 1):]
+
+
+
+def _merge_key_counts(key_arrays, count_arrays):
+    """
+    Returns the (sorted) distinct keys, and their total counts, 
+    in lists of arrays of keys and of their counts.
+    """
+    keys = numpy.concatenate(key_arrays)
+    counts = numpy.concatenate(count_arrays)
+    if len(keys) == 0:
+        return keys, counts
+
+    order = numpy.argsort(keys, kind="mergesort")
+    keys = keys[order]
+    counts = counts[order]
+    first_indices = numpy.flatnonzero(numpy.concatenate([[True], keys[1:] != keys[:-1]]))
+    return keys[first_indices], numpy.add.reduceat(counts, first_indices)
+
+
+
+def _clean_and_count(text_pieces, N, starts_with_caps="", ends_with_caps=""):
+    """
+    Cleans and counts the fragments of length N in a text given as 
+    an iterable of pieces, which start and end with the given strings, 
+    and returns a Counter of them.  Only one piece is cleaned at a time, 
+    but the counts are kept together across all of the pieces.
+
+    Fragments of length at most _MAX_PACKED_LENGTH are counted by their 
+    base 26 keys (compiled if possible), and only the distinct keys of 
+    the whole text are made into strings, at the end.
+    """
+    no_restrictions = (starts_with_caps == "" and ends_with_caps == "")
+
+    ## Single letters are counted by their (byte) character codes
+    if N == 1 and no_restrictions:
+        letter_counts = numpy.zeros(256, dtype=numpy.int64)
+        for clean_text in _clean_pieces(text_pieces, N):
+            letter_counts += numpy.bincount(numpy.frombuffer(clean_text, dtype=numpy.uint8), minlength=256)
+        return Counter(dict((chr(c), int(letter_counts[c]))  for c in letter_counts.nonzero()[0]))
+
+    ## Longer fragments are counted by their keys, where no fragment 
+    ## matches a longer or non-letter restriction.  The counts of each 
+    ## piece are merged once they add up to the number of keys so far.
+    if N <= _MAX_PACKED_LENGTH:
+        if len(starts_with_caps) > N or len(ends_with_caps) > N \
+                or not all([c in string.ascii_uppercase  for c in starts_with_caps + ends_with_caps]):
+            return Counter()
+        if numba is not None:
+            count_keys = _count_fragment_keys
+        else:
+            count_keys = _vectorized_count_fragment_keys
+        restriction_keys = (_encode_fragment_key(starts_with_caps), len(starts_with_caps),
+                            _encode_fragment_key(ends_with_caps), len(ends_with_caps))
+
+        distinct_keys = numpy.zeros(0, dtype=numpy.int64)
+        key_counts = numpy.zeros(0, dtype=numpy.int64)
+        new_key_arrays = []
+        new_count_arrays = []
+        new_key_total = 0
+        for clean_text in _clean_pieces(text_pieces, N):
+            letter_codes = numpy.frombuffer(clean_text, dtype=numpy.uint8).astype(numpy.int64) - ord("A")
+            piece_keys, piece_counts = count_keys(letter_codes, N, *restriction_keys)
+            new_key_arrays.append(piece_keys)
+            new_count_arrays.append(piece_counts)
+            new_key_total += len(piece_keys)
+            if new_key_total >= len(distinct_keys):
+                distinct_keys, key_counts = _merge_key_counts([distinct_keys] + new_key_arrays, [key_counts] + new_count_arrays)
+                new_key_arrays = []
+                new_count_arrays = []
+                new_key_total = 0
+        distinct_keys, key_counts = _merge_key_counts([distinct_keys] + new_key_arrays, [key_counts] + new_count_arrays)
+
+        return Counter(dict(zip(_decode_fragment_keys(distinct_keys, N), key_counts.tolist())))
+
+    ## Otherwise the fragment strings are counted, only testing the 
+    ## start/end restrictions when some are given
+    count_dictionary = Counter()
+    for clean_text in _clean_pieces(text_pieces, N):
+        fragments = (clean_text[i:i+N]  for i in xrange(len(clean_text) - N + 1))
+        if no_restrictions:
+            count_dictionary.update(fragments)
+        else:
+            count_dictionary.update(tmp_key  for tmp_key in fragments
+                                    if tmp_key.startswith(starts_with_caps)
+                                    and tmp_key.endswith(ends_with_caps))
+    return count_dictionary
+
+
 
 def letter_stats(input_text, fragment_length=1, starts_with="", ends_with="", show_at_most=None):
     """
     Computes the letter statistics for text fragments of size
     fragment_length within the given input text string.  All 
     text is converted to uppercase, and all non-alphabetic 
-    characters (including punctuation and spaces) are removed.
+    characters (including punctuation and spaces) are removed.  
+    Only the ASCII letters A-Z and a-z count as alphabetic here, 
+    so accented and other non-ASCII letters (e.g. u'\xe9') in 
+    unicode text are removed too.
 
     The default fragment length is 1, which counts single letters.
     If strings for starts_with and ends_with are specified, then the
@@ -114,12 +356,12 @@ def letter_stats(input_text, fragment_length=1, starts_with="", ends_with="", sh
 	sage: T2 = letter_stats(T, 2, starts_with="E")
 	EL -- 1 -- 16.7%
 	EI -- 1 -- 16.7%
-	ED -- 1 -- 16.7%
 	ET -- 1 -- 16.7%
+	ED -- 1 -- 16.7%
 	EP -- 1 -- 16.7%
 	ER -- 1 -- 16.7%
 	sage: T2
-	[['EL', 1], ['EI', 1], ['ED', 1], ['ET', 1], ['EP', 1], ['ER', 1]]
+	[['EL', 1], ['EI', 1], ['ET', 1], ['ED', 1], ['EP', 1], ['ER', 1]]
 
 	sage: T2 = letter_stats(T, 2, ends_with="E")
 	RE -- 2 -- 28.6%
@@ -136,61 +378,50 @@ def letter_stats(input_text, fragment_length=1, starts_with="", ends_with="", sh
 	LL -- 2 -- 100.0%
 
     """
-    ## If the text passed is a valid filename, load text from the file
-    import os.path 
-    if os.path.isfile(input_text):
-        new_file = open(input_text, "r")
-        text = new_file.read()
-        new_file.close()
-    else:
-        text = input_text
-
-
-
-    ## Initialize the count dictionary
-    count_dictionary = {}
     N = fragment_length
 
-    ## Clean the text to remove all non-alphabet 
-    ## characters and capitalize the others
-    clean_text = ""
-    for i in range(len(text)):
-        if text[i].isalpha():
-            clean_text += text[i].upper()
-
     ## Clean the message fragments
     starts_with_caps = starts_with.upper()
     ends_with_caps = ends_with.upper()
 
-    ## Count the fragments
-    total = 0
-    for i in range(len(clean_text) - N + 1):
-        tmp_key = clean_text[i:i+N]
-        if tmp_key.startswith(starts_with_caps) \
-                and tmp_key.endswith(ends_with_caps):
-            try:
-                count_dictionary[tmp_key] += 1
-            except:
-                count_dictionary[tmp_key] = 1    
-            total += 1
+    ## Clean and count the text in pieces, reading them from the 
+    ## file if the text passed is a valid filename
+    import os.path 
+    if os.path.isfile(input_text):
+        with open(input_text, "r") as new_file:
+            text_pieces = iter(lambda: new_file.read(_TEXT_PIECE_SIZE), "")
+            count_dictionary = _clean_and_count(text_pieces, N, starts_with_caps, ends_with_caps)
+    else:
+        text_pieces = (input_text[i: i + _TEXT_PIECE_SIZE]  for i in xrange(0, len(input_text), _TEXT_PIECE_SIZE))
+        count_dictionary = _clean_and_count(text_pieces, N, starts_with_caps, ends_with_caps)
+
+    total = sum(count_dictionary.values())
+
+    ## If no fragments were counted, there are no statistics (or percentages)
+    if total == 0:
+        return []
 
 
     ## Make a sorted list of statistics
-    L = [[k, count_dictionary[k]]  for k in count_dictionary.keys()]
-    import operator
-    L1 = sorted(L, key=operator.itemgetter(1), reverse=True)
+    L1 = [[k, v]  for k, v in count_dictionary.most_common()]
     
 
     ## Decide how many results to print
     if show_at_most == None:
-        show_range = range(len(L1))
+        show_count = len(L1)
     else:
-        show_range = range(min(len(L1), show_at_most))
+        show_count = min(len(L1), show_at_most)
 
 
-    ## Print the totals and percentages
-    for i in show_range:
-        print L1[i][0] + " -- " + str(L1[i][1]) + " -- " + str(round(100.0 * L1[i][1] / total, 1)) + "%"
+    ## Print the totals and percentages (with one write), where the percentages 
+    ## are computed together in numpy, but rounded with round() to keep its 
+    ## (half away from zero) rounding
+    import sys
+    shown_counts = [v  for k, v in L1[:show_count]]
+    percentages = (100.0 * numpy.array(shown_counts, dtype=float) / total).tolist()
+    rows = ["%s -- %d -- %s%%" % (L1[i][0], shown_counts[i], round(percentages[i], 1))  for i in range(show_count)]
+    if rows:
+        sys.stdout.write("\n".join(rows) + "\n")
 
     ## Return the dictionary
     return L1
@@ -201,6 +432,38 @@ def letter_stats(input_text, fragment_length=1, starts_with="", ends_with="", sh
 
 
 
+## The lookup tables made for each alphabet string, shared by all codes with that 
+## alphabet, where the cache is emptied when it reaches the maximum number of alphabets
+_code_tables_cache = {}
+_CODE_TABLES_CACHE_SIZE = 32
+
+def _make_code_tables(alphabet_string):
+    """
+    Returns the (byte) lookup tables for encoding and decoding with 
+    the given (byte) str alphabet, which are made once per alphabet and 
+    are read-only since the codes share them.  In the encoding table 
+    -1 marks characters not in the alphabet, and filling it backwards 
+    gives a repeated character the index of its first appearance.
+    """
+    try:
+        return _code_tables_cache[alphabet_string]
+    except KeyError:
+        pass
+
+    encoding_table = numpy.empty(256, dtype=numpy.intp)
+    encoding_table.fill(-1)
+    for i in reversed(range(len(alphabet_string))):
+        encoding_table[ord(alphabet_string[i])] = i
+    encoding_table.flags.writeable = False
+    decoding_table = numpy.frombuffer(alphabet_string, dtype=numpy.uint8)
+
+    if len(_code_tables_cache) >= _CODE_TABLES_CACHE_SIZE:
+        _code_tables_cache.clear()
+    _code_tables_cache[alphabet_string] = (encoding_table, decoding_table)
+    return encoding_table, decoding_table
+
+
+
 class CodeForAlphabet(SageObject):
     """
     A code which translates from tuples of characters
@@ -228,6 +491,12 @@ class CodeForAlphabet(SageObject):
 	    sage: C.decode(C.encode("AAABCEE"))
 	    'AAABCEE'
 
+	    sage: U = code(u"ABC")
+	    sage: U.encode(u"CAB")
+	    [2, 0, 1]
+	    sage: U.decode([1, 2])
+	    u'BC'
+
         """
         self.__codeword_length = word_length
         self.__alphabet_string = alphabet_string
@@ -237,6 +506,13 @@ class CodeForAlphabet(SageObject):
 
         ## TO DO: Check that there are no repeated characters in the defining string!
 
+        ## Get the (shared) lookup tables for encoding and decoding, which 
+        ## are only made for alphabets of one byte characters (i.e. a str)
+        if isinstance(alphabet_string, str):
+            self.__encoding_table, self.__decoding_table = _make_code_tables(alphabet_string)
+        else:
+            self.__encoding_table, self.__decoding_table = None, None
+
     
     def __repr__(self):
         return "A code of word length " + str(self.__codeword_length) + " based on the string: " + self.__alphabet_string 
@@ -250,10 +526,14 @@ class CodeForAlphabet(SageObject):
         if self.__codeword_length != 1:
             raise NotImplementedError, "Need to add support for word length > 1."
 
-        num_list = []
-        for i in range(len(text_str)):
-            num_list.append(self.__alphabet_string.index(text_str[i]))
-        return num_list
+        ## Look up all characters of a str at once, or each of them otherwise (e.g. for unicode)
+        if self.__encoding_table is not None and isinstance(text_str, str):
+            num_array = self.__encoding_table[numpy.frombuffer(text_str, dtype=numpy.uint8)]
+            if (num_array < 0).any():
+                raise ValueError, "The text contains characters which are not in the string: " + self.__alphabet_string
+            return num_array.tolist()
+
+        return [self.__alphabet_string.index(c)  for c in text_str]
 
 
     def decode(self, num_list):
@@ -263,15 +543,40 @@ class CodeForAlphabet(SageObject):
         if self.__codeword_length != 1:
             raise NotImplementedError, "Need to add support for word length > 1."
 
-        new_string = ""
-        for i in range(len(num_list)):
-            new_string += self.__alphabet_string[num_list[i]]
-        return new_string
+        if self.__decoding_table is not None:
+            return self.__decoding_table[numpy.asarray(num_list, dtype=numpy.intp)].tostring()
+
+        return "".join([self.__alphabet_string[i]  for i in num_list])
+
+
+
 
 
 
 
 
+## The number of words from which HillCipher multiplies with numpy, instead of word by word
+_HILL_NUMPY_MIN_WORDS = 32
+
+
+
+def _make_Hill_word_function(n):
+    """
+    Returns a function f(P, K, N) which multiplies the word P (a list 
+    of n integers) by the n x n matrix whose entries are listed row 
+    by row in K, mod N.  All of the products are written out in the 
+    generated source of f, so it has no loops.
+
+    EXAMPLES:
+        sage: f = _make_Hill_word_function(2)
+        sage: f([1, 1], [1, 2, 0, 1], 3)
+        [0, 1]
+    """
+    rows = ["(" + " + ".join(["K[%d]*P[%d]" % (r*n + c, c)  for c in range(n)]) + ") % N"  for r in range(n)]
+    source = "def f(P, K, N):\n    return [" + ", ".join(rows) + "]\n"
+    namespace = {}
+    exec source in namespace
+    return namespace["f"]
 
 
 
@@ -337,6 +642,11 @@ class HillCipher(SageObject):
 	    raise RuntimeError, "Cannot find the inverse of the matrix ", mod_matrix_inv
 
 
+	## Store the keys as immutable copies, so the accessors can return them without copying
+	mod_matrix = mod_matrix.__copy__()
+	mod_matrix.set_immutable()
+	mod_matrix_inv.set_immutable()
+
 	## Store the keys and modulus
 	if pass_decryption_key == False:
 	    self.__encryption_matrix = mod_matrix
@@ -346,6 +656,24 @@ class HillCipher(SageObject):
 	    self.__encryption_matrix = mod_matrix_inv
 	    self.__decryption_matrix = mod_matrix
        	    self.__modulus = N
+
+	## Cache the keys as lists of their (Python) integer entries, row by row, 
+	## and as arrays of the smallest integer type where the product entries cannot 
+	## overflow (e.g. int16 for N = 26), or None if they could overflow any machine integer
+	n = self.block_size()
+	self.__int_modulus = int(N)
+	encryption_rows = [[int(a) for a in row] for row in self.__encryption_matrix.rows()]
+	decryption_rows = [[int(a) for a in row] for row in self.__decryption_matrix.rows()]
+	self.__encryption_entries = sum(encryption_rows, [])
+	self.__decryption_entries = sum(decryption_rows, [])
+	self.__apply_to_word = _make_Hill_word_function(n)
+	self.__encryption_array = None
+	self.__decryption_array = None
+	for dtype in [numpy.int16, numpy.int32, numpy.int64]:
+	    if n * (self.__int_modulus - 1)**2 <= numpy.iinfo(dtype).max:
+	        self.__encryption_array = numpy.array(encryption_rows, dtype=dtype)
+	        self.__decryption_array = numpy.array(decryption_rows, dtype=dtype)
+	        break
 	
 
 
@@ -357,7 +685,7 @@ class HillCipher(SageObject):
 
 
     def modulus(self):
-	return deepcopy(self.__modulus)
+	return self.__modulus
 
 
     def block_size(self):
@@ -365,11 +693,11 @@ class HillCipher(SageObject):
 
 
     def encryption_key(self):
-	return deepcopy(self.__encryption_matrix)
+	return self.__encryption_matrix
 
 
     def decryption_key(self):
-	return deepcopy(self.__decryption_matrix)
+	return self.__decryption_matrix
 
 
 
@@ -377,46 +705,50 @@ class HillCipher(SageObject):
         """
         Encrypt the plaintext.
         """
-	return self.__apply_Hill_matrix__(self.__encryption_matrix, plaintext_num_list, padding_char="")
+	return self.__apply_Hill_matrix__(self.__encryption_entries, self.__encryption_array, plaintext_num_list, padding_char="")
 
 
     def decrypt(self, ciphertext_num_list, padding_char=""):
 	"""
 	Decrypt the Ciphertext with the decryption key.
 	"""
-	return self.__apply_Hill_matrix__(self.__decryption_matrix, ciphertext_num_list, padding_char="")
+	return self.__apply_Hill_matrix__(self.__decryption_entries, self.__decryption_array, ciphertext_num_list, padding_char="")
 
 
 
-    def __apply_Hill_matrix__(self, key_matrix, plaintext_num_list, padding_char=""):
+    def __apply_Hill_matrix__(self, key_entries, key_array, plaintext_num_list, padding_char=""):
         """
-        Encrypt the given text by left-multiplying by the key_matrix.
+        Encrypt the given text by left-multiplying by the key matrix, 
+        given both as a list of its integer entries (row by row), and 
+        as an integer array (or None if the products could overflow).
         """
         n = self.block_size()
-        N = self.__modulus
-
-
-        R = IntegerModRing(N)
-        MS = MatrixSpace(R, n, n) 
-        A = MS(key_matrix)
+        N = self.__int_modulus
 
-        CT_num_list = []
-        for word_index in range(0, len(plaintext_num_list), n):
-            PT_word = plaintext_num_list[word_index: word_index + n]
-
-            if len(PT_word) != n:
-                if len(padding_char) != 1:
-                    raise RuntimeError, "Additional padding is needed for the word: " + str(PT_word) + "."
-                else:
-                    PT_word += (n - len(PT_word)) * padding_char
-
-            
+        ## Pad the last word if needed
+        PT_num_list = list(plaintext_num_list)
+        extra_length = len(PT_num_list) % n
+        if extra_length != 0:
+            if len(padding_char) != 1:
+                raise RuntimeError, "Additional padding is needed for the word: " + str(PT_num_list[-extra_length:]) + "."
+            else:
+                PT_num_list += (n - extra_length) * [padding_char]
 
-            CT_word_mod = A * vector(PT_word) 
-            CT_num_list += [c.lift() for c in CT_word_mod]
+        ## For a few words, or when the product entries could overflow 
+        ## machine integers, multiply each word using Python integers
+        PT_num_list = [int(x) % N  for x in PT_num_list]
+        if len(PT_num_list) < _HILL_NUMPY_MIN_WORDS * n or key_array is None:
+            apply_to_word = self.__apply_to_word
+            CT_num_list = []
+            for word_index in range(0, len(PT_num_list), n):
+                CT_num_list += apply_to_word(PT_num_list[word_index: word_index + n], key_entries, N)
+            return CT_num_list
 
+        ## Otherwise apply the key matrix to all words at once, as the columns of one matrix
+        PT_words = numpy.array(PT_num_list, dtype=key_array.dtype).reshape(-1, n).T
+        CT_words = numpy.dot(key_array, PT_words) % N
 
-        return CT_num_list
+        return CT_words.T.ravel().tolist()
 
 
 
@@ -431,6 +763,8 @@ def PermutationCipher(key_list, plaintext, padding_char="X"):
         sage: perm_key = [2, 1, 0]
 	sage: PermutationCipher(perm_key, "HelloThere")
 	'leHTolrehXXe'
+	sage: PermutationCipher(perm_key, u"HelloThere")
+	u'leHTolrehXXe'
 
 
     TO DO:
@@ -439,23 +773,29 @@ def PermutationCipher(key_list, plaintext, padding_char="X"):
 
     """
     n = len(key_list)
-    CT_str = ""
-    for word_index in range(0, len(plaintext), n):
-        PT_word = plaintext[word_index: word_index + n]
-        
-        if len(PT_word) != n:
-            if len(padding_char) != 1:
-                raise RuntimeError, "Additional padding is needed for the word: " + str(PT_word) + "."
-            else:
-                PT_word += (n - len(PT_word)) * padding_char
-
-        CT_word = ""
-        PT_word_list = list(PT_word)
-        for i in range(n):
-            CT_word += PT_word[key_list[i]]
-
-        CT_str += CT_word
 
+    ## Pad the last word if needed
+    extra_length = len(plaintext) % n
+    if extra_length != 0:
+        if len(padding_char) != 1:
+            raise RuntimeError, "Additional padding is needed for the word: " + str(plaintext[-extra_length:]) + "."
+        else:
+            plaintext += (n - extra_length) * padding_char
+
+    ## Permute text which is not a (byte) str, e.g. unicode, one word at a time
+    if not isinstance(plaintext, str):
+        return "".join([plaintext[word_index: word_index + n][k]  for word_index in range(0, len(plaintext), n)  for k in key_list])
+
+    ## Check the key entries are indices of a word (as indexing each word would)
+    key_array = numpy.asarray(key_list, dtype=numpy.intp)
+    if len(plaintext) > 0 and ((key_array < -n) | (key_array >= n)).any():
+        raise IndexError, "The key entries must be indices of a word of length " + str(n) + "."
+    key_array %= n
+
+    ## Read the characters of all words in the key order at once
+    word_starts = numpy.arange(0, len(plaintext), n)
+    indices = (word_starts[:, numpy.newaxis] + key_array).ravel()
+    CT_str = numpy.frombuffer(plaintext, dtype=numpy.uint8)[indices].tostring()
 
     return CT_str
 